@@ -2,7 +2,11 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import io
 from datetime import datetime, timedelta
+from pathlib import Path
 
 # --- 1. Configuración Inicial de la Página ---
 st.set_page_config(
@@ -13,40 +17,97 @@ st.set_page_config(
 
 # --- 2. Generación y Caching de Datos (Simulación de BD) ---
 
-@st.cache_data
-def load_data():
+# Carpeta donde se persisten los datos generados entre reinicios del servidor
+CACHE_DIR = Path('.cache')
+
+# Semilla del generador aleatorio, para que la simulación sea reproducible
+RANDOM_SEED = 42
+
+def generate_data():
     """
     Simula la obtención de datos de ventas. Genera un DataFrame aleatorio
     con 180 días de datos para un cálculo de delta más robusto.
     """
 
     # Parámetros de la simulación
+    rng = np.random.default_rng(RANDOM_SEED)
     start_date = datetime.now() - timedelta(days=180)
-    dates = [start_date + timedelta(days=i) for i in range(180)]
-    products = ['Laptop Pro', 'Monitor 4K', 'Tablet', 'Auriculares BT', 'Cargador Inalámbrico']
-
-    # Creación de filas de datos
-    data = []
-    for date in dates:
-        # Generamos entre 10 y 30 transacciones por día
-        num_transactions = np.random.randint(10, 30)
-        for _ in range(num_transactions):
-            data.append({
-                'fecha': date,
-                'producto': np.random.choice(products),
-                # Ventas aleatorias
-                'ventas': np.random.randint(50, 5000)
-            })
-
-    df = pd.DataFrame(data)
-
-    # Aseguramos que 'fecha' sea tipo datetime
-    df['fecha'] = pd.to_datetime(df['fecha'])
+    dates = pd.date_range(start=start_date, periods=180, freq='D')
+    products = np.asarray(['Laptop Pro', 'Monitor 4K', 'Tablet', 'Auriculares BT', 'Cargador Inalámbrico'])
+
+    # Generamos entre 10 y 30 transacciones por día
+    counts = rng.integers(10, 30, size=len(dates))
+    total_rows = counts.sum()
+
+    # Creación vectorizada de todas las filas (sin bucles de Python)
+    df = pd.DataFrame({
+        'fecha': np.repeat(dates, counts),
+        'producto': rng.choice(products, size=total_rows),
+        # Ventas aleatorias
+        'ventas': rng.integers(50, 5000, size=total_rows)
+    })
+
+    # 'producto' tiene pocos valores distintos: como categoría, los filtros
+    # y agrupaciones trabajan sobre códigos enteros en lugar de strings
+    df['producto'] = df['producto'].astype('category')
+
+    # Ordenamos por fecha para poder filtrar rangos con búsqueda binaria
+    df = df.sort_values('fecha', kind='stable').reset_index(drop=True)
+
+    return df
+
+@st.cache_data
+def load_data():
+    """
+    Carga los datos de ventas desde un archivo Parquet local y, si no existe,
+    los genera y los guarda. El archivo se renueva cada día para que el rango
+    de fechas simulado siga terminando en la fecha actual.
+    """
+    path = CACHE_DIR / f"ventas_{datetime.now().strftime('%Y%m%d')}.parquet"
+    if path.exists():
+        return pd.read_parquet(path, engine='pyarrow')
+
+    df = generate_data()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path, engine='pyarrow', compression='snappy', index=False)
 
     return df
 
+def slice_date_range(df, start, end):
+    """
+    Devuelve las filas de un DataFrame ordenado por 'fecha' comprendidas entre
+    las fechas start y end (ambas inclusive), usando búsqueda binaria.
+    """
+    lo, hi = df['fecha'].values.searchsorted([
+        np.datetime64(start),
+        np.datetime64(end) + np.timedelta64(1, 'D')
+    ])
+    return df.iloc[lo:hi]
+
 # --- 3. Lógica de Filtros (Barra Lateral) ---
 
+@st.cache_data
+def filter_data(_df, productos, start, end):
+    """
+    Aplica los filtros de Producto y Fecha. El resultado se cachea por la
+    combinación de filtros; _df (el DataFrame de load_data) no forma parte
+    de la clave para evitar hashearlo en cada interacción.
+    """
+    # Sin copia previa: cada filtro ya devuelve un nuevo DataFrame y
+    # st.cache_data entrega una copia del resultado en cada llamada
+    df_filtrado = _df
+
+    # Aplicar Filtro de Fecha
+    if start is not None and end is not None:
+        df_filtrado = slice_date_range(df_filtrado, start, end)
+
+    # Aplicar Filtro de Producto (sobre el tramo de fechas ya recortado)
+    if productos:
+        df_filtrado = df_filtrado[df_filtrado['producto'].isin(productos)]
+
+    return df_filtrado
+
 def create_sidebar(df):
     """
     Crea la barra lateral de control y aplica los filtros de Producto y Fecha.
@@ -62,9 +123,10 @@ def create_sidebar(df):
             default=all_products
         )
 
-        # Filtro de Fecha (Rango de Fechas)
-        min_date = df['fecha'].min().date()
-        max_date = df['fecha'].max().date()
+        # Filtro de Fecha (Rango de Fechas); df viene ordenado por fecha,
+        # así que los extremos son la primera y la última fila
+        min_date = df['fecha'].iloc[0].date()
+        max_date = df['fecha'].iloc[-1].date()
 
         date_range = st.date_input(
             "Seleccionar Rango de Fechas",
@@ -73,23 +135,13 @@ def create_sidebar(df):
             max_value=max_date
         )
 
-    df_filtrado = df.copy()
-
-    # Aplicar Filtro de Producto
-    if producto_seleccionado:
-        df_filtrado = df_filtrado[df_filtrado['producto'].isin(producto_seleccionado)]
-
-    # Aplicar Filtro de Fecha (si se seleccionan ambas fechas)
-    if len(date_range) == 2:
-        start, end = date_range
-        df_filtrado = df_filtrado[
-            (df_filtrado['fecha'].dt.date >= start) &
-            (df_filtrado['fecha'].dt.date <= end)
-            ]
+    # Aplicar Filtro de Fecha solo si se seleccionan ambas fechas
+    start, end = date_range if len(date_range) == 2 else (None, None)
+    df_filtrado = filter_data(df, tuple(producto_seleccionado), start, end)
 
     st.sidebar.info(f"Registros filtrados: {len(df_filtrado):,}")
 
-    return df_filtrado, date_range
+    return df_filtrado, date_range, producto_seleccionado
 
 # --- 4. Cálculo y Despliegue de Métricas (Delta Dinámico) ---
 
@@ -99,7 +151,20 @@ def calculate_delta(current_value, prior_value):
         return None
     return ((current_value - prior_value) / prior_value) * 100
 
-def display_metrics(df_actual, df_original, date_range):
+def summarize_sales(df):
+    """
+    Calcula las ventas totales, los productos únicos y la venta promedio
+    recorriendo la columna 'ventas' una sola vez.
+    """
+    ventas = df['ventas'].values
+    total = ventas.sum()
+    promedio = total / len(ventas) if len(ventas) else np.nan
+
+    # Productos únicos: contamos los códigos de categoría presentes
+    productos_unicos = np.count_nonzero(np.bincount(df['producto'].cat.codes.values))
+    return total, productos_unicos, promedio
+
+def display_metrics(df_actual, df_original, date_range, productos_seleccionados):
     """
     Calcula el periodo anterior, el delta y muestra las métricas en un contenedor.
     """
@@ -118,23 +183,23 @@ def display_metrics(df_actual, df_original, date_range):
             prior_start_date = prior_end_date - timedelta(days=period_duration - 1)
 
             # Filtrar el DataFrame original para obtener el periodo anterior
-            df_prior = df_original[
-                (df_original['fecha'].dt.date >= prior_start_date) &
-                (df_original['fecha'].dt.date <= prior_end_date)
-                ]
+            df_prior = slice_date_range(df_original, prior_start_date, prior_end_date)
 
-            # Aplicar filtro de productos a df_prior
-            productos_actuales = df_actual['producto'].unique()
-            df_prior = df_prior[df_prior['producto'].isin(productos_actuales)]
+            # Aplicar a df_prior el mismo filtro de productos de la barra lateral
+            if productos_seleccionados:
+                df_prior = df_prior[df_prior['producto'].isin(productos_seleccionados)]
 
+        # 4.2 Agregados de ambos periodos (una pasada por DataFrame)
+        total_venta_actual, productos_unicos_actual, promedio_venta_actual = summarize_sales(df_actual)
+
+        total_venta_prior, productos_unicos_prior, promedio_venta_prior = 0, 0, 0
+        if df_prior is not None and not df_prior.empty:
+            total_venta_prior, productos_unicos_prior, promedio_venta_prior = summarize_sales(df_prior)
 
         col1, col2, col3 = st.columns(3)
 
         # --- Métrica 1: Ventas Totales ---
         with col1:
-            total_venta_actual = df_actual['ventas'].sum()
-            total_venta_prior = df_prior['ventas'].sum() if df_prior is not None else 0
-
             delta_venta = calculate_delta(total_venta_actual, total_venta_prior)
             delta_str = f"{delta_venta:.2f}%" if delta_venta is not None else 'N/A'
 
@@ -146,9 +211,6 @@ def display_metrics(df_actual, df_original, date_range):
 
         # --- Métrica 2: Productos Activos (Únicos) ---
         with col2:
-            productos_unicos_actual = df_actual['producto'].nunique()
-            productos_unicos_prior = df_prior['producto'].nunique() if df_prior is not None else 0
-
             delta_productos = productos_unicos_actual - productos_unicos_prior
 
             st.metric(
@@ -159,9 +221,6 @@ def display_metrics(df_actual, df_original, date_range):
 
         # --- Métrica 3: Promedio de Venta ---
         with col3:
-            promedio_venta_actual = df_actual['ventas'].mean()
-            promedio_venta_prior = df_prior['ventas'].mean() if df_prior is not None and not df_prior.empty else 0
-
             delta_promedio = calculate_delta(promedio_venta_actual, promedio_venta_prior)
 
             # Formato de delta
@@ -179,44 +238,109 @@ def display_metrics(df_actual, df_original, date_range):
 
 # --- 5. Despliegue de Gráficos, Tabla y Exportación ---
 
+# Máximo de puntos que se envían al navegador en el gráfico de línea
+MAX_PUNTOS_LINEA = 1000
+
+def downsample_lttb(df, x, y, n_out=MAX_PUNTOS_LINEA):
+    """
+    Reduce una serie temporal a n_out puntos con el algoritmo
+    Largest-Triangle-Three-Buckets, conservando la forma visual de la curva.
+    """
+    n = len(df)
+    if n <= n_out or n_out < 3:
+        return df
+
+    x_vals = pd.to_datetime(df[x]).values.astype('datetime64[ns]').astype('int64').astype('float64')
+    y_vals = df[y].values.astype('float64')
+
+    # El primer y el último punto se conservan siempre
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+    selected = np.empty(n_out, dtype='int64')
+    selected[0], selected[-1] = 0, n - 1
+
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+
+        # Punto promedio del siguiente bucket
+        avg_x = x_vals[end:next_end].mean()
+        avg_y = y_vals[end:next_end].mean()
+
+        # Elegimos el punto que forma el triángulo de mayor área
+        area = np.abs(
+            (x_vals[prev] - avg_x) * (y_vals[start:end] - y_vals[prev]) -
+            (x_vals[prev] - x_vals[start:end]) * (avg_y - y_vals[prev])
+        )
+        prev = start + area.argmax()
+        selected[i + 1] = prev
+
+    return df.iloc[selected]
+
+@st.cache_data
+def aggregate_by_day(df):
+    """Suma las ventas por día para el gráfico de tendencia."""
+    if df.empty:
+        return pd.DataFrame({'Fecha': pd.Series(dtype='datetime64[ns]'), 'Ventas': pd.Series(dtype='int64')})
+
+    # df ya viene ordenado por fecha: cada día es un tramo contiguo de filas
+    dias = df['fecha'].values.astype('datetime64[D]')
+    fechas, inicios = np.unique(dias, return_index=True)
+    ventas = np.add.reduceat(df['ventas'].values, inicios)
+    return pd.DataFrame({'Fecha': fechas.astype('datetime64[ns]'), 'Ventas': ventas})
+
+@st.cache_data
+def aggregate_by_product(df):
+    """Suma las ventas por producto para los gráficos de barras y de dona."""
+    # Sumamos sobre los códigos de la categoría y descartamos los no observados
+    categorias = df['producto'].cat.categories
+    codigos = df['producto'].cat.codes.values
+    ventas = df['ventas'].values
+    conteos = np.bincount(codigos, minlength=len(categorias))
+    sumas = np.bincount(codigos, weights=ventas, minlength=len(categorias)).astype(ventas.dtype)
+    observados = conteos > 0
+    return pd.DataFrame({'Producto': categorias[observados], 'Ventas': sumas[observados]})
+
 def display_charts(df):
     """
     Crea y muestra los tres gráficos, el botón de descarga y la tabla de datos.
     """
     st.subheader("Visualizaciones Detalladas")
 
+    # Agrupar y sumar las ventas por producto (compartido por barras y dona)
+    ventas_por_producto = aggregate_by_product(df)
+
     # 5.1 Fila superior de gráficos (Línea y Barras)
     col_chart1, col_chart2 = st.columns(2)
 
     with col_chart1:
         st.markdown("##### Tendencia de Ventas Diarias (Línea)")
         # Agrupamos las ventas por día para la tendencia
-        df_tendencia = df.groupby(df['fecha'].dt.date)['ventas'].sum().reset_index()
-        df_tendencia.columns = ['Fecha', 'Ventas']
+        df_tendencia = downsample_lttb(aggregate_by_day(df), 'Fecha', 'Ventas')
 
         fig_lineas = px.line(
             data_frame=df_tendencia,
             x='Fecha',
             y='Ventas',
-            template='plotly_dark'
+            template='plotly_dark',
+            # WebGL rasteriza en GPU; usar render_mode='svg' si el navegador
+            # no dispone de WebGL (p. ej. equipos corporativos restringidos)
+            render_mode='webgl'
         )
-        fig_lineas.update_layout(height=450, margin=dict(t=30, b=0, l=0, r=0))
+        # uirevision fijo: Plotly.js conserva zoom/estado y solo actualiza trazas
+        fig_lineas.update_layout(height=450, margin=dict(t=30, b=0, l=0, r=0), uirevision='keep')
         st.plotly_chart(fig_lineas, use_container_width=True)
 
     with col_chart2:
         st.markdown("##### Ventas Agrupadas por Artículo (Barras)")
 
-        # Agrupar y sumar las ventas por producto
-        ventas_por_producto = df.groupby('producto')['ventas'].sum().reset_index()
-        ventas_por_producto.columns = ['Producto', 'Ventas']
-
         fig_barras = px.bar(
             data_frame=ventas_por_producto,
             x='Producto',
             y='Ventas',
             template='plotly_dark'
         )
-        fig_barras.update_layout(height=450, margin=dict(t=30, b=0, l=0, r=0))
+        fig_barras.update_layout(height=450, margin=dict(t=30, b=0, l=0, r=0), uirevision='keep')
         st.plotly_chart(fig_barras, use_container_width=True)
 
 
@@ -227,8 +351,6 @@ def display_charts(df):
 
     with col_pie_chart:
         st.markdown("##### Distribución Porcentual de Ventas")
-        ventas_por_producto = df.groupby('producto')['ventas'].sum().reset_index()
-        ventas_por_producto.columns = ['Producto', 'Ventas']
 
         fig_pie = px.pie(
             ventas_por_producto,
@@ -241,7 +363,7 @@ def display_charts(df):
         if len(ventas_por_producto) > 8:
             fig_pie.update_layout(showlegend=False)
 
-        fig_pie.update_layout(height=350, margin=dict(t=30, b=0, l=0, r=0))
+        fig_pie.update_layout(height=350, margin=dict(t=30, b=0, l=0, r=0), uirevision='keep')
         st.plotly_chart(fig_pie, use_container_width=True)
 
 
@@ -250,10 +372,16 @@ def display_charts(df):
         st.markdown("##### Exportar Datos Filtrados")
         st.write("Utiliza este botón para descargar el conjunto de datos detallados, tal como aparecen tras aplicar los filtros.")
 
-        # Función para convertir el DataFrame a CSV
+        # Función para convertir el DataFrame a CSV (escritor en C++ de PyArrow)
         @st.cache_data
         def convert_df_to_csv(df):
-            return df.to_csv(index=False).encode('utf-8')
+            buffer = io.BytesIO()
+            pacsv.write_csv(
+                pa.Table.from_pandas(df, preserve_index=False),
+                buffer,
+                write_options=pacsv.WriteOptions(quoting_style='needed')
+            )
+            return buffer.getvalue()
 
         csv = convert_df_to_csv(df)
 
@@ -272,12 +400,15 @@ def display_charts(df):
     with st.expander("Ver datos detallados de la tabla y formato", expanded=False):
         st.markdown("##### Datos Brutos Filtrados")
 
-        # Aplicar formato de moneda y fecha usando Pandas Styler para mejor visualización
+        # Formateamos la fecha de forma vectorizada (sin Pandas Styler, que
+        # genera HTML celda por celda) y dejamos 'ventas' numérica para que
+        # el navegador aplique el formato de moneda
+        df_display = df.assign(fecha=df['fecha'].dt.strftime('%Y-%m-%d %H:%M'))
         st.dataframe(
-            df.style.format({
-                'fecha': lambda t: t.strftime('%Y-%m-%d %H:%M'),
-                'ventas': '${:,.2f}'
-            }),
+            df_display,
+            column_config={
+                'ventas': st.column_config.NumberColumn(format='dollar')
+            },
             use_container_width=True
         )
 
@@ -295,10 +426,10 @@ def main():
     df_original = load_data()
 
     # 2. Crear barra lateral y obtener datos filtrados y rango de fechas
-    df_filtrado, date_range = create_sidebar(df_original)
+    df_filtrado, date_range, productos_seleccionados = create_sidebar(df_original)
 
     # 3. Mostrar las métricas con cálculo de delta dinámico
-    display_metrics(df_filtrado, df_original, date_range)
+    display_metrics(df_filtrado, df_original, date_range, productos_seleccionados)
 
     # 4. Mostrar gráficos, distribución, descarga y tabla
     display_charts(df_filtrado)